@@ -14,14 +14,35 @@ Invoke via CLI or interactive console to wrap a target command. Use --python to
 force Python interception if auto-detection is insufficient.
 """
 import argparse
+import asyncio
+import hashlib
+import importlib.machinery
+import importlib.util
 import json
+import marshal
 import os
+import queue
+import re
+import selectors
 import shlex
+import shutil
+import stat
+import struct
 import subprocess
 import sys
 import tempfile
 import threading
-from typing import Iterable, List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+if os.name == "nt":
+    import msvcrt
+
+json_loads = orjson.loads if orjson is not None else json.loads
 
 BANNER = r"""
 ╔════════════════════════════╗
@@ -32,140 +53,751 @@ BANNER = r"""
 """
 
 INTERCEPT_PREFIX = "[INTERCEPT]"
+INTERCEPT_PREFIX_B = INTERCEPT_PREFIX.encode("ascii")
+READ_CHUNK = 65536
+# Intercept log: LOG_MAGIC, then one record per event made of a fixed
+# LOG_RECORD header (time_ns, event code, body length) and the JSON body.
+# Replay tools can skip or filter records without parsing JSON.
+LOG_MAGIC = b"SBXLOG1\n"
+LOG_RECORD = struct.Struct("<qBI")
+EVENT_CODES = {"http": 1, "dns": 2, "socket": 3, "process": 4}  # 0: anything else
+
+# Pipes are only selectable on POSIX; elsewhere the reader does blocking reads.
+USE_SELECTOR = os.name == "posix"
 
 # Embedded sitecustomize payload that hooks common exfil/IO primitives (Python-only).
-SITECUSTOMIZE_CODE = "\n".join(
-    [
-        "import datetime",
-        "import json",
-        "import socket",
-        "import sys",
-        "",
-        'PREFIX = "[INTERCEPT]"',
-        "",
-        "def emit(event, data):",
-        "    record = {",
-        '        "time": datetime.datetime.utcnow().isoformat(),',
-        '        "event": event,',
-        '        "data": data,',
-        "    }",
-        "    try:",
-        '        sys.stdout.write(PREFIX + " " + json.dumps(record) + "\\n")',
-        "        sys.stdout.flush()",
-        "    except Exception:",
-        "        pass",
-        "",
-        "def safe_hook(apply):",
-        "    try:",
-        "        apply()",
-        "    except Exception:",
-        "        pass",
-        "",
-        "def hook_socket():",
-        '    if getattr(socket.socket.connect, "_sandbox_hook", False):',
-        "        return",
-        "    _orig_connect = socket.socket.connect",
-        "    def wrapped_connect(self, address):",
-        '        emit("socket", {"address": address})',
-        "        return _orig_connect(self, address)",
-        "    wrapped_connect._sandbox_hook = True",
-        "    socket.socket.connect = wrapped_connect",
-        "    _orig_create_connection = socket.create_connection",
-        "    def wrapped_create(addr, *a, **kw):",
-        '        emit("socket", {"address": addr})',
-        "        return _orig_create_connection(addr, *a, **kw)",
-        "    wrapped_create._sandbox_hook = True",
-        "    socket.create_connection = wrapped_create",
-        "    _orig_getaddrinfo = socket.getaddrinfo",
-        "    def wrapped_dns(*a, **kw):",
-        '        host = a[0] if a else kw.get("host")',
-        '        emit("dns", {"host": host})',
-        "        return _orig_getaddrinfo(*a, **kw)",
-        "    wrapped_dns._sandbox_hook = True",
-        "    socket.getaddrinfo = wrapped_dns",
-        "",
-        "def hook_requests():",
-        "    try:",
-        "        import requests",
-        "    except Exception:",
-        "        return",
-        '    if getattr(requests.Session.request, "_sandbox_hook", False):',
-        "        return",
-        "    _orig_request = requests.Session.request",
-        "    def wrapped(self, method, url, *a, **kw):",
-        '        emit("http", {"method": method, "url": url})',
-        "        return _orig_request(self, method, url, *a, **kw)",
-        "    wrapped._sandbox_hook = True",
-        "    requests.Session.request = wrapped",
-        "",
-        "def hook_urllib():",
-        "    try:",
-        "        import urllib.request",
-        "    except Exception:",
-        "        return",
-        '    if getattr(urllib.request.urlopen, "_sandbox_hook", False):',
-        "        return",
-        "    _orig_urlopen = urllib.request.urlopen",
-        "    def wrapped(url, *a, **kw):",
-        '        method = kw.get("method") or "GET"',
-        '        emit("http", {"method": method, "url": url})',
-        "        return _orig_urlopen(url, *a, **kw)",
-        "    wrapped._sandbox_hook = True",
-        "    urllib.request.urlopen = wrapped",
-        "",
-        "def hook_http_client():",
-        "    try:",
-        "        import http.client",
-        "    except Exception:",
-        "        return",
-        '    if getattr(http.client.HTTPConnection.request, "_sandbox_hook", False):',
-        "        return",
-        "    _orig_request = http.client.HTTPConnection.request",
-        "    def wrapped(self, method, url, *a, **kw):",
-        '        emit("http", {"method": method, "url": url})',
-        "        return _orig_request(self, method, url, *a, **kw)",
-        "    wrapped._sandbox_hook = True",
-        "    http.client.HTTPConnection.request = wrapped",
-        "",
-        "def hook_subprocess():",
-        "    try:",
-        "        import subprocess",
-        "    except Exception:",
-        "        return",
-        '    if getattr(subprocess.Popen, "_sandbox_hook", False):',
-        "        return",
-        "    _orig_popen = subprocess.Popen",
-        "    def wrapped_popen(cmd, *a, **kw):",
-        "        try:",
-        "            if isinstance(cmd, (list, tuple)):",
-        "                cmdline = list(cmd)",
-        "            else:",
-        "                cmdline = [str(cmd)]",
-        "        except Exception:",
-        '            cmdline = ["<unserializable>"]',
-        '        emit("process", {"cmd": cmdline, "cwd": kw.get("cwd")})',
-        "        return _orig_popen(cmd, *a, **kw)",
-        "    wrapped_popen._sandbox_hook = True",
-        "    subprocess.Popen = wrapped_popen",
-        "",
-        "safe_hook(hook_socket)",
-        "safe_hook(hook_requests)",
-        "safe_hook(hook_urllib)",
-        "safe_hook(hook_http_client)",
-        "safe_hook(hook_subprocess)",
-        "",
-    ]
-)
+SITECUSTOMIZE_CODE = """\
+import atexit
+import json
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+PREFIX = b"[INTERCEPT]"
+PIPE_BUF = getattr(select, "PIPE_BUF", 512)
+
+def _time_ns_fallback():
+    return int(time.time() * 1e9)
+
+time_ns = getattr(time, "time_ns", _time_ns_fallback)  # Python < 3.7 has no time_ns
+
+def open_channel():
+    # Records go to a dedicated pipe from the console, never to the target's
+    # own stdout where they could land in the middle of a target line.
+    try:
+        value = int(os.environ["SANDBOX_HOOK_FD"])
+        if os.name == "nt":
+            import msvcrt
+            return msvcrt.open_osfhandle(value, os.O_WRONLY), None
+        dev, ino = os.environ["SANDBOX_HOOK_ID"].split(":")
+        return value, (int(dev), int(ino))
+    except Exception:
+        return None, None
+
+_fd, _fd_id = open_channel()
+
+def channel_ok():
+    # The fd number may have been closed or reused for a target file since
+    # startup; only ever write to the pipe the console handed us.
+    if _fd_id is None:
+        return _fd is not None
+    try:
+        st = os.fstat(_fd)
+    except OSError:
+        return False
+    return (st.st_dev, st.st_ino) == _fd_id
+
+def keep_channel(fds):
+    # Add the channel to the fds a child keeps across close_fds, so children
+    # that do not inherit everything still report.
+    if _fd is None or os.name == "nt" or not channel_ok():
+        return fds
+    return tuple(sorted(set(fds) | {_fd}))
+
+def write_records(data):
+    # Other hooked processes share the pipe: write whole records in chunks of
+    # at most PIPE_BUF so they stay atomic and never interleave.
+    start, size = 0, len(data)
+    while start < size:
+        end = start + PIPE_BUF
+        if end < size:
+            cut = data.rfind(b"\\n", start, end)
+            end = cut + 1 if cut != -1 else data.index(b"\\n", end) + 1
+        else:
+            end = size
+        chunk = data[start:end]
+        while chunk:
+            chunk = chunk[os.write(_fd, chunk):]
+        start = end
+
+def dumps(record):
+    if orjson is not None:
+        try:
+            return orjson.dumps(record, default=str)
+        except TypeError:
+            pass
+    return json.dumps(record, default=str).encode("utf-8")
+
+# Serialized record envelope up to the timestamp, per event name; only the
+# timestamp and data are formatted per call.
+_HEADS = {}
+
+def record_head(event):
+    head = _HEADS[event] = PREFIX + b' {"event":' + dumps(event) + b',"time":'
+    return head
+
+# Records are batched and written by a flusher thread instead of one
+# write syscall per event.
+FLUSH_INTERVAL = 0.01
+FLUSH_THRESHOLD = 16384
+
+_buf = bytearray()
+_buf_lock = threading.Lock()
+_pending = threading.Event()
+_flusher = None
+_pid = os.getpid()
+# Without register_at_fork (Python < 3.7) a fork is noticed on the next emit/flush.
+_AT_FORK = hasattr(os, "register_at_fork")
+
+def flush():
+    if not _AT_FORK and _pid != os.getpid():
+        reset_after_fork()
+    with _buf_lock:
+        if not _buf:
+            return
+        try:
+            if channel_ok():
+                write_records(bytes(_buf))
+        except Exception:
+            pass
+        del _buf[:]
+
+def flush_loop():
+    while True:
+        _pending.wait()
+        time.sleep(FLUSH_INTERVAL)
+        _pending.clear()
+        flush()
+
+def start_flusher():
+    global _flusher
+    _flusher = threading.Thread(target=flush_loop, name="sandbox-flush")
+    _flusher.daemon = True
+    try:
+        _flusher.start()
+    except RuntimeError:
+        # Interpreter shutdown; atexit still flushes.
+        pass
+
+def reset_after_fork():
+    global _buf_lock, _flusher, _pid
+    # The parent still owns (and will flush) whatever was buffered.
+    _pid = os.getpid()
+    _buf_lock = threading.Lock()
+    del _buf[:]
+    _pending.clear()
+    _flusher = None
+
+def emit(event, data):
+    if _fd is None:
+        return
+    try:
+        head = _HEADS.get(event) or record_head(event)
+        line = b"".join((head, b"%d" % time_ns(), b',"data":', dumps(data), b"}\\n"))
+    except Exception:
+        return
+    if not _AT_FORK and _pid != os.getpid():
+        reset_after_fork()
+    with _buf_lock:
+        _buf.extend(line)
+        size = len(_buf)
+    if size > FLUSH_THRESHOLD:
+        flush()
+    elif _flusher is None:
+        start_flusher()
+    _pending.set()
+
+atexit.register(flush)
+if _AT_FORK:
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+def safe_hook(apply):
+    try:
+        apply()
+    except Exception:
+        pass
+
+def native_hooks_active():
+    # Set by the LD_PRELOAD library's constructor in this very process.
+    return os.environ.get("SANDBOX_NATIVE_PID") == str(os.getpid())
+
+def hook_socket():
+    if getattr(socket.socket.connect, "_sandbox_hook", False):
+        return
+    native = native_hooks_active()
+    # Families whose connect(2) the native library already reports.
+    native_families = (
+        {socket.AF_INET, socket.AF_INET6, getattr(socket, "AF_UNIX", None)} if native else ()
+    )
+    _orig_connect = socket.socket.connect
+    def wrapped_connect(self, address):
+        if self.family not in native_families:
+            emit("socket", {"address": address})
+        return _orig_connect(self, address)
+    wrapped_connect._sandbox_hook = True
+    socket.socket.connect = wrapped_connect
+    _orig_create_connection = socket.create_connection
+    def wrapped_create(addr, *a, **kw):
+        emit("socket", {"address": addr})
+        return _orig_create_connection(addr, *a, **kw)
+    wrapped_create._sandbox_hook = True
+    socket.create_connection = wrapped_create
+    if native:
+        return  # getaddrinfo is reported at the libc level
+    _orig_getaddrinfo = socket.getaddrinfo
+    def wrapped_dns(*a, **kw):
+        host = a[0] if a else kw.get("host")
+        emit("dns", {"host": host})
+        return _orig_getaddrinfo(*a, **kw)
+    wrapped_dns._sandbox_hook = True
+    socket.getaddrinfo = wrapped_dns
+
+def hook_requests():
+    try:
+        import requests
+    except Exception:
+        return
+    if getattr(requests.Session.request, "_sandbox_hook", False):
+        return
+    _orig_request = requests.Session.request
+    def wrapped(self, method, url, *a, **kw):
+        emit("http", {"method": method, "url": url})
+        return _orig_request(self, method, url, *a, **kw)
+    wrapped._sandbox_hook = True
+    requests.Session.request = wrapped
+
+def hook_urllib():
+    try:
+        import urllib.request
+    except Exception:
+        return
+    if getattr(urllib.request.urlopen, "_sandbox_hook", False):
+        return
+    _orig_urlopen = urllib.request.urlopen
+    def wrapped(url, *a, **kw):
+        method = kw.get("method") or "GET"
+        emit("http", {"method": method, "url": url})
+        return _orig_urlopen(url, *a, **kw)
+    wrapped._sandbox_hook = True
+    urllib.request.urlopen = wrapped
+
+def hook_http_client():
+    try:
+        import http.client
+    except Exception:
+        return
+    if getattr(http.client.HTTPConnection.request, "_sandbox_hook", False):
+        return
+    _orig_request = http.client.HTTPConnection.request
+    def wrapped(self, method, url, *a, **kw):
+        emit("http", {"method": method, "url": url})
+        return _orig_request(self, method, url, *a, **kw)
+    wrapped._sandbox_hook = True
+    http.client.HTTPConnection.request = wrapped
+
+def flushing(orig):
+    def wrapped(*a, **kw):
+        flush()
+        return orig(*a, **kw)
+    wrapped._sandbox_hook = True
+    return wrapped
+
+def hook_exit():
+    # os._exit and exec skip atexit; push out buffered records first.
+    for name in ("_exit", "execv", "execve"):
+        orig = getattr(os, name, None)
+        if orig is None or getattr(orig, "_sandbox_hook", False):
+            continue
+        setattr(os, name, flushing(orig))
+
+def hook_subprocess():
+    try:
+        import subprocess
+    except Exception:
+        return
+    if getattr(subprocess.Popen, "_sandbox_hook", False):
+        return
+    _orig_popen = subprocess.Popen
+    def wrapped_popen(cmd, *a, **kw):
+        try:
+            if isinstance(cmd, (list, tuple)):
+                cmdline = list(cmd)
+            else:
+                cmdline = [str(cmd)]
+        except Exception:
+            cmdline = ["<unserializable>"]
+        emit("process", {"cmd": cmdline, "cwd": kw.get("cwd")})
+        # close_fds is on by default; an explicit close_fds=False already
+        # inherits the channel and must not be overridden by pass_fds.
+        if sys.version_info[0] >= 3 and len(a) < 7 and kw.get("close_fds", True):
+            kw["pass_fds"] = keep_channel(tuple(kw.get("pass_fds", ())))
+        return _orig_popen(cmd, *a, **kw)
+    wrapped_popen._sandbox_hook = True
+    subprocess.Popen = wrapped_popen
+
+def hook_spawn():
+    # multiprocessing's spawn and forkserver (and subprocess, which may bind
+    # fork_exec on import) start children through _posixsubprocess with only
+    # the fds they list in fds_to_keep.
+    try:
+        import _posixsubprocess
+    except Exception:
+        return
+    _orig_fork_exec = _posixsubprocess.fork_exec
+    if getattr(_orig_fork_exec, "_sandbox_hook", False):
+        return
+    def wrapped(args, executable_list, close_fds, fds_to_keep, *rest):
+        return _orig_fork_exec(args, executable_list, close_fds, keep_channel(fds_to_keep), *rest)
+    wrapped._sandbox_hook = True
+    _posixsubprocess.fork_exec = wrapped
+
+safe_hook(hook_spawn)
+safe_hook(hook_socket)
+safe_hook(hook_requests)
+safe_hook(hook_urllib)
+safe_hook(hook_http_client)
+safe_hook(hook_subprocess)
+safe_hook(hook_exit)
+"""
+
+PAYLOAD_DIGEST = hashlib.blake2b(SITECUSTOMIZE_CODE.encode("utf-8"), digest_size=8).hexdigest()
+# Private dir used for the rest of the process when the shared name is taken.
+_fallback_payload_dir: Optional[str] = None
+# Expected bytecode per sitecustomize.py path, built once per process.
+_payload_pyc: Dict[str, bytes] = {}
+
+
+# Hooks (Python payload and native library) report over a dedicated pipe.
+# HOOK_FD_ENV names its write end (a Windows handle on Windows) and
+# HOOK_ID_ENV its "st_dev:st_ino", so hooks can tell it from a reused fd.
+HOOK_FD_ENV = "SANDBOX_HOOK_FD"
+HOOK_ID_ENV = "SANDBOX_HOOK_ID"
+
+# LD_PRELOAD library (Linux) reporting connect(2)/getaddrinfo(3) for any
+# dynamically linked target, Python or not.
+NATIVE_HOOK_SOURCE = r"""/* LD_PRELOAD hooks for raw (and Python) targets: report connect(2) and
+ * getaddrinfo(3) as [INTERCEPT] records on the pipe named by SANDBOX_HOOK_FD
+ * and identified by SANDBOX_HOOK_ID ("st_dev:st_ino"). */
+#define _GNU_SOURCE
+#include <arpa/inet.h>
+#include <dlfcn.h>
+#include <errno.h>
+#include <netdb.h>
+#include <netinet/in.h>
+#include <stddef.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/un.h>
+#include <time.h>
+#include <unistd.h>
+
+static int hook_fd = -1;
+static unsigned long long hook_dev, hook_ino;
+static int (*real_connect)(int, const struct sockaddr *, socklen_t);
+static int (*real_getaddrinfo)(const char *, const char *, const struct addrinfo *, struct addrinfo **);
+
+/* The fd number alone proves nothing: a descendant may have closed it or
+ * reused it for one of its own files. Only ever write to the console's pipe. */
+static int hook_ok(void) {
+    struct stat st;
+    return hook_fd >= 0 && fstat(hook_fd, &st) == 0 &&
+           (unsigned long long)st.st_dev == hook_dev && (unsigned long long)st.st_ino == hook_ino;
+}
+
+__attribute__((constructor)) static void sandbox_hook_init(void) {
+    const char *fd = getenv("SANDBOX_HOOK_FD");
+    const char *id = getenv("SANDBOX_HOOK_ID");
+    char pid[32];
+    real_connect = dlsym(RTLD_NEXT, "connect");
+    real_getaddrinfo = dlsym(RTLD_NEXT, "getaddrinfo");
+    if (!fd || !id || sscanf(id, "%llu:%llu", &hook_dev, &hook_ino) != 2)
+        return;
+    hook_fd = atoi(fd);
+    if (!hook_ok()) {
+        hook_fd = -1;
+        return;
+    }
+    /* Tells the Python payload that libc-level socket hooks are live in this process. */
+    snprintf(pid, sizeof pid, "%d", (int)getpid());
+    setenv("SANDBOX_NATIVE_PID", pid, 1);
+}
+
+static void emit(const char *event, const char *data) {
+    char line[1024];
+    struct timespec ts;
+    int n, saved = errno;
+    if (!hook_ok()) {
+        errno = saved;
+        return;
+    }
+    clock_gettime(CLOCK_REALTIME, &ts);
+    n = snprintf(line, sizeof line, "[INTERCEPT] {\"event\":\"%s\",\"time\":%lld,\"data\":%s}\n",
+                 event, (long long)ts.tv_sec * 1000000000LL + ts.tv_nsec, data);
+    /* Lines stay under PIPE_BUF, so concurrent writers never interleave. */
+    if (n > 0 && n < (int)sizeof line && write(hook_fd, line, (size_t)n) < 0) {
+        /* nothing useful to do */
+    }
+    errno = saved;
+}
+
+/* Length of the well-formed UTF-8 sequence at s, or 0 if there is none. */
+static size_t utf8_len(const unsigned char *s) {
+    size_t n, k;
+    unsigned char lo = 0x80, hi = 0xbf;
+    if (s[0] >= 0xc2 && s[0] <= 0xdf)
+        n = 2;
+    else if (s[0] >= 0xe0 && s[0] <= 0xef)
+        n = 3;
+    else if (s[0] >= 0xf0 && s[0] <= 0xf4)
+        n = 4;
+    else
+        return 0;
+    /* Reject overlong forms, surrogates and code points past U+10FFFF. */
+    if (s[0] == 0xe0)
+        lo = 0xa0;
+    else if (s[0] == 0xed)
+        hi = 0x9f;
+    else if (s[0] == 0xf0)
+        lo = 0x90;
+    else if (s[0] == 0xf4)
+        hi = 0x8f;
+    if (s[1] < lo || s[1] > hi)
+        return 0;
+    for (k = 2; k < n; k++)
+        if (s[k] < 0x80 || s[k] > 0xbf)
+            return 0;
+    return n;
+}
+
+/* JSON-quote s into dst. Valid UTF-8 passes through as is; stray bytes and
+ * control characters are escaped as \u00XX. */
+static void json_string(char *dst, size_t cap, const char *s) {
+    static const char hex[] = "0123456789abcdef";
+    size_t i = 0, n;
+    dst[i++] = '"';
+    while (*s && i + 8 < cap) {
+        unsigned char c = (unsigned char)*s;
+        if (c == '"' || c == '\\') {
+            dst[i++] = '\\';
+            dst[i++] = (char)c;
+        } else if (c >= 0x80 && (n = utf8_len((const unsigned char *)s)) != 0) {
+            if (i + n + 8 >= cap)
+                break;
+            memcpy(dst + i, s, n);
+            i += n;
+            s += n;
+            continue;
+        } else if (c < 0x20 || c >= 0x7f) {
+            dst[i++] = '\\';
+            dst[i++] = 'u';
+            dst[i++] = '0';
+            dst[i++] = '0';
+            dst[i++] = hex[c >> 4];
+            dst[i++] = hex[c & 15];
+        } else {
+            dst[i++] = (char)c;
+        }
+        s++;
+    }
+    dst[i++] = '"';
+    dst[i] = '\0';
+}
+
+static void emit_unix(const struct sockaddr_un *un, socklen_t len) {
+    char path[sizeof un->sun_path + 1], esc[sizeof un->sun_path * 6 + 3], data[sizeof esc + 16];
+    size_t n = len - offsetof(struct sockaddr_un, sun_path);
+    if (n > sizeof un->sun_path)
+        n = sizeof un->sun_path;
+    memcpy(path, un->sun_path, n);
+    path[n] = '\0';
+    if (n && path[0] == '\0')
+        path[0] = '@'; /* abstract namespace */
+    json_string(esc, sizeof esc, path);
+    snprintf(data, sizeof data, "{\"address\":%s}", esc);
+    emit("socket", data);
+}
+
+int connect(int fd, const struct sockaddr *addr, socklen_t len) {
+    char host[INET6_ADDRSTRLEN], data[128];
+    unsigned port = 0;
+    const void *src = NULL;
+    if (addr && addr->sa_family == AF_UNIX && len > offsetof(struct sockaddr_un, sun_path)) {
+        emit_unix((const struct sockaddr_un *)addr, len);
+    } else if (addr && addr->sa_family == AF_INET && len >= sizeof(struct sockaddr_in)) {
+        src = &((const struct sockaddr_in *)addr)->sin_addr;
+        port = ntohs(((const struct sockaddr_in *)addr)->sin_port);
+    } else if (addr && addr->sa_family == AF_INET6 && len >= sizeof(struct sockaddr_in6)) {
+        src = &((const struct sockaddr_in6 *)addr)->sin6_addr;
+        port = ntohs(((const struct sockaddr_in6 *)addr)->sin6_port);
+    }
+    if (src && inet_ntop(addr->sa_family, src, host, sizeof host)) {
+        snprintf(data, sizeof data, "{\"address\":[\"%s\",%u]}", host, port);
+        emit("socket", data);
+    }
+    if (!real_connect)
+        real_connect = dlsym(RTLD_NEXT, "connect");
+    return real_connect(fd, addr, len);
+}
+
+int getaddrinfo(const char *node, const char *service, const struct addrinfo *hints, struct addrinfo **res) {
+    char host[600], data[640];
+    if (node) {
+        json_string(host, sizeof host, node);
+        snprintf(data, sizeof data, "{\"host\":%s}", host);
+        emit("dns", data);
+    }
+    if (!real_getaddrinfo)
+        real_getaddrinfo = dlsym(RTLD_NEXT, "getaddrinfo");
+    return real_getaddrinfo(node, service, hints, res);
+}
+"""
+
+NATIVE_HOOK_DIGEST = hashlib.blake2b(NATIVE_HOOK_SOURCE.encode("utf-8"), digest_size=8).hexdigest()
+_native_hook_failed = False
+# Library built by this process; the shared cached copy is checked against it.
+_native_hook_image: Optional[bytes] = None
+
+
+def _is_private_dir(path: str) -> bool:
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+        return False
+    return True
+
+
+def _write_if_changed(path: str, data: bytes) -> bool:
+    """Atomically replace ``path`` with ``data`` unless it already holds exactly that.
+
+    Returns True if the file was (re)written.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _prune_payload_dir(path: str) -> None:
+    """Remove anything importable from ``path`` other than sitecustomize.py.
+
+    The dir sits ahead of the stdlib on every hooked target's PYTHONPATH and
+    targets can write to it, so a planted ``json.py`` or ``socket/`` would
+    otherwise shadow real modules in every later run.
+    """
+    suffixes = tuple(importlib.machinery.all_suffixes())
+    for entry in os.scandir(path):
+        name = entry.name
+        if name in ("sitecustomize.py", "__pycache__"):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if name.isidentifier():
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif name.endswith(suffixes) or (entry.is_symlink() and name.isidentifier()):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _payload_bytecode(sc_path: str) -> bytes:
+    """Return the checked-hash .pyc image of the payload, as py_compile would write it."""
+    data = _payload_pyc.get(sc_path)
+    if data is None:
+        source = SITECUSTOMIZE_CODE.encode("utf-8")
+        code = compile(source, sc_path, "exec", dont_inherit=True)
+        data = _payload_pyc[sc_path] = b"".join((
+            importlib.util.MAGIC_NUMBER,
+            (0b11).to_bytes(4, "little"),  # hash-based, check_source
+            importlib.util.source_hash(source),
+            marshal.dumps(code),
+        ))
+    return data
+
+
+def payload_dir() -> str:
+    """Return a directory containing sitecustomize.py, rewriting it only if it changed.
+
+    The directory is keyed by the payload digest, so it is shared by every run
+    (and every console) using the same payload instead of being rebuilt per run.
+    Its contents are re-checked on every call, since earlier targets could write there.
+    """
+    global _fallback_payload_dir
+    owner = f"{os.getuid()}-" if hasattr(os, "getuid") else ""
+    path = os.path.join(tempfile.gettempdir(), f"sbxrun-{owner}{PAYLOAD_DIGEST}")
+    if _fallback_payload_dir is not None and _is_private_dir(_fallback_payload_dir):
+        path = _fallback_payload_dir
+    else:
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+        if not _is_private_dir(path):
+            # Someone else owns the shared name; never import a payload we did not
+            # write. Reuse one private dir for the rest of this process instead.
+            path = _fallback_payload_dir = tempfile.mkdtemp(prefix=f"sbxrun-{PAYLOAD_DIGEST}-")
+
+    _prune_payload_dir(path)
+    sc_path = os.path.join(path, "sitecustomize.py")
+    _write_if_changed(sc_path, SITECUSTOMIZE_CODE.encode("utf-8"))
+
+    # Children on this interpreter version load the bytecode without parsing
+    # the source. It is hash-checked against the source on import and
+    # compared with the image we built ourselves here, so bytecode left by a
+    # target is neither trusted nor kept; neither is any other cached .pyc.
+    pyc_path = importlib.util.cache_from_source(sc_path)
+    try:
+        pycache = os.path.dirname(pyc_path)
+        os.makedirs(pycache, exist_ok=True)
+        for entry in os.scandir(pycache):
+            if entry.path == pyc_path or entry.name.endswith(".tmp"):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+        _write_if_changed(pyc_path, _payload_bytecode(sc_path))
+    except OSError:
+        pass  # children simply compile it themselves
+    return path
+
+def _build_native_hook() -> Optional[bytes]:
+    """Compile NATIVE_HOOK_SOURCE in a private build dir and return the library image."""
+    cc = shutil.which("cc")
+    if cc is None:
+        return None
+    with tempfile.TemporaryDirectory(prefix="sbxbuild-") as build_dir:
+        src_path = os.path.join(build_dir, "sandbox_hook.c")
+        so_path = os.path.join(build_dir, "sandbox_hook.so")
+        with open(src_path, "w", encoding="utf-8") as f:
+            f.write(NATIVE_HOOK_SOURCE)
+        result = subprocess.run(
+            [cc, "-shared", "-fPIC", "-O2", "-o", so_path, src_path, "-ldl"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        if result.returncode != 0:
+            return None
+        with open(so_path, "rb") as f:
+            return f.read()
+
+def native_hook_path(cache_dir: str) -> Optional[str]:
+    """Return the LD_PRELOAD hook library, installed in ``cache_dir``.
+
+    The library is compiled once per process and the copy in ``cache_dir`` is
+    compared with it before every run, since earlier targets could have
+    replaced it. Returns None where it cannot be used (non-Linux, no C
+    compiler, build failure); callers then rely on the Python payload alone.
+    """
+    global _native_hook_failed, _native_hook_image
+    if _native_hook_failed or not sys.platform.startswith("linux"):
+        return None
+    so_path = os.path.join(cache_dir, f"sandbox_hook-{NATIVE_HOOK_DIGEST}.so")
+    # LD_PRELOAD is split on spaces and colons.
+    if " " in so_path or ":" in so_path:
+        _native_hook_failed = True
+        return None
+    try:
+        if _native_hook_image is None:
+            _native_hook_image = _build_native_hook()
+        if _native_hook_image is None:
+            _native_hook_failed = True
+            return None
+        _write_if_changed(so_path, _native_hook_image)
+    except OSError:
+        _native_hook_failed = True
+        return None
+    return so_path
+
+def resolve_executable(cmd: List[str], env: Optional[Dict[str, str]]) -> Optional[str]:
+    """Return an absolute path for a bare ``cmd[0]`` on POSIX, else None.
+
+    subprocess only launches through posix_spawn (vfork-style, no page table
+    copy of this process) when the executable has a directory part, no new
+    session/process group is requested and close_fds is off. The trade-off
+    is that the target shares our session, so a terminal Ctrl-C reaches it
+    as well; stop() still terminates it explicitly.
+    """
+    if os.name != "posix" or not cmd or os.sep in cmd[0]:
+        return None
+    path = (env if env is not None else os.environ).get("PATH")
+    return shutil.which(cmd[0], path=path)
+
+# python, python3, python3.12, python3.13t, python3m, pythonw, python3.exe, ...
+# (with ABI suffixes) but not pythonista.
+_PYTHON_BIN_RE = re.compile(r"python(\d+(\.\d+)*)?[dmt]*w?(\.exe)?")
 
 def looks_like_python(cmd: List[str]) -> bool:
     if not cmd:
         return False
-    head = cmd[0].lower()
-    if head.endswith(".py"):
-        return True
-    if os.path.basename(head).startswith("python"):
-        return True
-    return False
+    head = os.path.basename(cmd[0]).lower()
+    return head.endswith(".py") or _PYTHON_BIN_RE.fullmatch(head) is not None
+
+_HTTP_FMT = "[HTTP] {} {}\n".format
+_DNS_FMT = "[DNS ] {}\n".format
+_SOCK_FMT = "[SOCK] {}:{}\n".format
+_PROC_FMT = "[PROC] {}\n".format
+
+
+def _format_http(data: dict) -> str:
+    get = data.get
+    return _HTTP_FMT(get("method", "?"), get("url", "?"))
+
+
+def _format_dns(data: dict) -> str:
+    return _DNS_FMT(data.get("host"))
+
+
+def _format_socket(data: dict) -> str:
+    addr = data.get("address")
+    if isinstance(addr, (list, tuple)) and len(addr) >= 2:
+        return _SOCK_FMT(addr[0], addr[1])
+    return _SOCK_FMT(addr, "?")
+
+
+def _format_process(data: dict) -> str:
+    cmd = data.get("cmd")
+    return _PROC_FMT(" ".join(map(str, cmd)) if isinstance(cmd, (list, tuple)) else cmd)
+
+
+# Console line renderers keyed by intercept event name.
+EVENT_FORMATTERS: Dict[str, Callable[[dict], str]] = {
+    "http": _format_http,
+    "dns": _format_dns,
+    "socket": _format_socket,
+    "process": _format_process,
+}
 
 class SandboxRunner:
     def __init__(self) -> None:
@@ -177,34 +809,86 @@ class SandboxRunner:
     def running(self) -> bool:
         return self.proc is not None and self.proc.poll() is None
 
-    def start(self, cmd: List[str], force_python: bool = False) -> None:
-        if self.running():
-            raise RuntimeError("A command is already running.")
+    def _prepare(
+        self, cmd: List[str], force_python: bool
+    ) -> Tuple[Optional[Dict[str, str]], Optional[Tuple[int, int]]]:
+        """Set up the per-run log dir and hook channel.
 
+        Returns (env for the child, hook pipe (read, write) fds or None).
+        """
         python_mode = force_python or looks_like_python(cmd)
-
-        env = os.environ.copy()
         self.tempdir = None
+        self.log_path = None
 
+        sc_dir = payload_dir() if python_mode or sys.platform.startswith("linux") else None
+        hook_lib = native_hook_path(sc_dir) if sc_dir else None
+        if not python_mode and hook_lib is None:
+            return None, None  # raw mode without hooks: no intercept log
+
+        assert sc_dir
+        env = os.environ.copy()
+        # Only the intercept log is per-run; the payload itself is reused.
+        self.tempdir = tempfile.TemporaryDirectory(prefix="run-", dir=sc_dir)
+        self.log_path = os.path.join(self.tempdir.name, "events.bin")
         if python_mode:
-            self.tempdir = tempfile.TemporaryDirectory()
-            sc_path = os.path.join(self.tempdir.name, "sitecustomize.py")
-            with open(sc_path, "w", encoding="utf-8") as f:
-                f.write(SITECUSTOMIZE_CODE)
-            env["PYTHONPATH"] = self.tempdir.name + os.pathsep + env.get("PYTHONPATH", "")
+            env["PYTHONPATH"] = sc_dir + os.pathsep + env.get("PYTHONPATH", "")
             env["PYTHONUNBUFFERED"] = "1"
-            self.log_path = os.path.join(self.tempdir.name, "events.jsonl")
+
+        if hook_lib:
+            preload = env.get("LD_PRELOAD")
+            env["LD_PRELOAD"] = f"{hook_lib} {preload}" if preload else hook_lib
+
+        hook_r, hook_w = os.pipe()
+        # Reaches the child (and its children) because close_fds is off.
+        os.set_inheritable(hook_w, True)
+        if os.name == "nt":
+            env[HOOK_FD_ENV] = str(msvcrt.get_osfhandle(hook_w))
         else:
-            self.log_path = None  # no intercept log in raw mode
-
-        self.proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            env=env if python_mode else None,
-        )
-        self.reader_thread = threading.Thread(target=self._reader, args=(python_mode,), daemon=True)
+            st = os.fstat(hook_w)
+            env[HOOK_FD_ENV] = str(hook_w)
+            env[HOOK_ID_ENV] = f"{st.st_dev}:{st.st_ino}"
+        return env, (hook_r, hook_w)
+
+    def _cleanup(self) -> None:
+        if self.tempdir:
+            self.tempdir.cleanup()
+            self.tempdir = None
+            self.log_path = None
+
+    def start(self, cmd: List[str], force_python: bool = False) -> None:
+        if self.running():
+            raise RuntimeError("A command is already running.")
+
+        env, hook_pipe = self._prepare(cmd, force_python)
+
+        # A bare pipe rather than subprocess.PIPE: the reader owns the read end
+        # and can multiplex it with the hook pipe. Intercepts only ever arrive
+        # on the hook pipe; target stdout is passed through untouched.
+        out_r, out_w = os.pipe()
+        streams = {out_r: False}
+        if hook_pipe:
+            streams[hook_pipe[0]] = True
+        try:
+            self.proc = subprocess.Popen(
+                cmd,
+                executable=resolve_executable(cmd, env),
+                stdout=out_w,
+                stderr=subprocess.STDOUT,
+                env=env,
+                # Our own fds are non-inheritable (PEP 446), so there is nothing
+                # for the child to close and no reason to sweep the fd table.
+                close_fds=False,
+            )
+        except BaseException:
+            for fd in streams:
+                os.close(fd)
+            self._cleanup()
+            raise
+        finally:
+            os.close(out_w)
+            if hook_pipe:
+                os.close(hook_pipe[1])
+        self.reader_thread = threading.Thread(target=self._reader, args=(streams,), daemon=True)
         self.reader_thread.start()
 
     def stop(self) -> None:
@@ -216,11 +900,80 @@ class SandboxRunner:
                 self.proc.wait(timeout=3)
             except subprocess.TimeoutExpired:
                 self.proc.kill()
+        reader = self.reader_thread
+        if reader and reader is not threading.current_thread():
+            # Let the reader drain and close the log before its dir goes away.
+            reader.join(timeout=3)
         self.proc = None
-        if self.tempdir:
-            self.tempdir.cleanup()
-            self.tempdir = None
-            self.log_path = None
+        self._cleanup()
+
+    def run(self, cmd: List[str], force_python: bool = False) -> int:
+        """Run ``cmd`` to completion on an asyncio event loop, without a reader thread."""
+        env, hook_pipe = self._prepare(cmd, force_python)
+        try:
+            return asyncio.run(self._run_async(cmd, env, hook_pipe))
+        finally:
+            self._cleanup()
+
+    async def _run_async(
+        self,
+        cmd: List[str],
+        env: Optional[Dict[str, str]],
+        hook_pipe: Optional[Tuple[int, int]],
+    ) -> int:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                executable=resolve_executable(cmd, env),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                env=env,
+                close_fds=False,
+            )
+        except BaseException:
+            if hook_pipe:
+                os.close(hook_pipe[0])
+            raise
+        finally:
+            if hook_pipe:
+                os.close(hook_pipe[1])
+        print("[*] Target started.")
+        assert proc.stdout
+        out = sys.stdout.buffer
+        sys.stdout.flush()
+        log_q, log_thread = self._start_log_writer()
+        try:
+            drains = [self._drain_stream(proc.stdout, False, log_q, out)]
+            if hook_pipe and USE_SELECTOR:
+                hook_reader = asyncio.StreamReader()
+                await asyncio.get_running_loop().connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(hook_reader), os.fdopen(hook_pipe[0], "rb", 0)
+                )
+                drains.append(self._drain_stream(hook_reader, True, log_q, out))
+            elif hook_pipe:
+                # The proactor loop cannot watch an anonymous os.pipe(); read it on a worker.
+                drains.append(asyncio.to_thread(self._pump, {hook_pipe[0]: True}, log_q, out))
+            await asyncio.gather(*drains)
+            code = await proc.wait()
+        finally:
+            if proc.returncode is None:
+                proc.terminate()
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=3)
+                except asyncio.TimeoutError:
+                    proc.kill()
+            self._stop_log_writer(log_q, log_thread)
+        print(f"[*] Target exited with code {code}")
+        return code
+
+    async def _drain_stream(self, reader: asyncio.StreamReader, intercepts: bool, log_q, out) -> None:
+        buf = bytearray()
+        while True:
+            chunk = await reader.read(READ_CHUNK)
+            buf += chunk
+            self._drain_lines(buf, intercepts, log_q, out, eof=not chunk)
+            if not chunk:
+                return
 
     def status(self) -> str:
         if not self.proc:
@@ -229,62 +982,191 @@ class SandboxRunner:
             return "running"
         return f"exited ({self.proc.poll()})"
 
-    def _reader(self, python_mode: bool) -> None:
-        assert self.proc and self.proc.stdout
-        log = None
-        if python_mode and self.log_path:
-            log = open(self.log_path, "a", encoding="utf-8")
+    def _reader(self, streams: Dict[int, bool]) -> None:
+        assert self.proc
+        out = sys.stdout.buffer
+        sys.stdout.flush()
+        log_q, log_thread = self._start_log_writer()
         try:
-            for raw in self.proc.stdout:
-                if python_mode and raw.startswith(INTERCEPT_PREFIX):
-                    self._handle_intercept(raw, log)
-                    continue
-                print(f"[OUT ] {raw}", end="")
+            self._pump(streams, log_q, out)
         finally:
-            if log:
-                log.close()
+            self._stop_log_writer(log_q, log_thread)
         code = self.proc.wait()
         print(f"[*] Target exited with code {code}")
 
-    def _handle_intercept(self, raw: str, log_file) -> None:
-        try:
-            payload = json.loads(raw.replace(INTERCEPT_PREFIX, "", 1).strip())
-        except json.JSONDecodeError:
-            print(f"[WARN] Could not decode intercept line: {raw.strip()}")
+    def _pump(self, streams: Dict[int, bool], log_q, out) -> None:
+        """Drain and close every fd in ``streams`` (fd -> parse intercepts) until EOF."""
+        bufs = {fd: bytearray() for fd in streams}
+
+        def feed(fd: int, chunk: bytes) -> bool:
+            buf = bufs[fd]
+            buf += chunk
+            self._drain_lines(buf, streams[fd], log_q, out, eof=not chunk)
+            if not chunk:
+                os.close(fd)
+            return bool(chunk)
+
+        if not USE_SELECTOR:
+            # Windows cannot select() on pipes: one blocking reader per stream,
+            # so a full hook pipe can never stall the target behind stdout.
+            def drain(fd: int) -> None:
+                while feed(fd, os.read(fd, READ_CHUNK)):
+                    pass
+
+            first, *rest = streams
+            extra = [threading.Thread(target=drain, args=(fd,), daemon=True) for fd in rest]
+            for t in extra:
+                t.start()
+            drain(first)
+            for t in extra:
+                t.join()
             return
 
-        if log_file:
-            log_file.write(json.dumps(payload) + "\n")
-            log_file.flush()
+        with selectors.DefaultSelector() as sel:
+            for fd in streams:
+                os.set_blocking(fd, False)
+                sel.register(fd, selectors.EVENT_READ)
+            while sel.get_map():
+                for key, _ in sel.select():
+                    try:
+                        chunk = os.read(key.fd, READ_CHUNK)
+                    except BlockingIOError:
+                        continue
+                    if not chunk:
+                        sel.unregister(key.fd)
+                    feed(key.fd, chunk)
+
+    def _start_log_writer(self) -> Tuple[Optional["queue.SimpleQueue[Optional[bytes]]"], Optional[threading.Thread]]:
+        if not self.log_path:
+            return None, None
+        log_q: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        log_thread = threading.Thread(target=self._log_writer, args=(self.log_path, log_q), daemon=True)
+        log_thread.start()
+        return log_q, log_thread
+
+    @staticmethod
+    def _stop_log_writer(log_q, log_thread: Optional[threading.Thread]) -> None:
+        if log_q is not None and log_thread:
+            log_q.put(None)
+            log_thread.join()
+
+    @staticmethod
+    def _log_writer(path: str, log_q: "queue.SimpleQueue[Optional[bytes]]") -> None:
+        """Append queued log records until a ``None`` sentinel, flushing whenever the queue runs dry."""
+        with open(path, "ab") as f:
+            if f.tell() == 0:
+                f.write(LOG_MAGIC)
+            while True:
+                item = log_q.get()
+                if item is None:
+                    break
+                f.write(item)
+                if log_q.empty():
+                    f.flush()
+
+    def _drain_lines(self, buf: bytearray, intercepts: bool, log_q, out, eof: bool = False) -> None:
+        """Write out every complete line in ``buf`` and drop it; only intercepts get decoded."""
+        if eof and buf and not buf.endswith(b"\n"):
+            buf += b"\n"  # unterminated last line
+        if not intercepts:
+            # Nothing to parse: tag the whole block of complete lines in one pass.
+            end = buf.rfind(b"\n") + 1
+            if end:
+                out.write(b"[OUT ] " + bytes(buf[:end - 1]).replace(b"\n", b"\n[OUT ] ") + b"\n")
+                del buf[:end]
+                out.flush()
+            return
+
+        # Hot loop: keep every lookup in fast locals.
+        prefix = INTERCEPT_PREFIX_B
+        find = buf.find
+        write = out.write
+        handle = self._handle_intercept
+        start = 0
+        while True:
+            nl = find(b"\n", start)
+            if nl == -1:
+                break
+            line = bytes(buf[start:nl + 1])
+            start = nl + 1
+            if line.startswith(prefix):
+                # json.loads accepts lone surrogates ("\udcff"), which UTF-8 cannot encode.
+                write(handle(line, log_q).encode("utf-8", "backslashreplace"))
+            else:
+                write(b"[OUT ] " + line)
+        del buf[:start]
+        out.flush()
+
+    def _handle_intercept(
+        self,
+        raw: bytes,
+        log_q,
+        *,
+        _skip: int = len(INTERCEPT_PREFIX_B),
+        _loads: Callable[[bytes], Any] = json_loads,
+        _pack: Callable[..., bytes] = LOG_RECORD.pack,
+        _codes: Dict[str, int] = EVENT_CODES,
+        _formatters: Dict[str, Callable[[dict], str]] = EVENT_FORMATTERS,
+    ) -> str:
+        # The keyword-only defaults bind module globals as fast locals; callers never pass them.
+        # The record is already JSON; log it verbatim instead of re-serializing.
+        record = raw[_skip:].strip()
+        try:
+            payload = _loads(record)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            text = raw.decode("utf-8", "replace").strip()
+            return f"[WARN] Could not decode intercept line: {text}\n"
 
         event = payload.get("event")
         data = payload.get("data", {})
 
-        if event == "http":
-            method = str(data.get("method", "?")).upper()
-            url = data.get("url", "?")
-            print(f"[HTTP] {method} {url}")
-        elif event == "dns":
-            print(f"[DNS ] {data.get('host')}")
-        elif event == "socket":
-            addr = data.get("address")
-            if isinstance(addr, (list, tuple)) and len(addr) >= 2:
-                host, port = addr[0], addr[1]
-            else:
-                host, port = addr, "?"
-            print(f"[SOCK] {host}:{port}")
-        elif event == "process":
-            cmd = data.get("cmd")
-            cmd_display = " ".join(cmd) if isinstance(cmd, (list, tuple)) else str(cmd)
-            print(f"[PROC] {cmd_display}")
-        else:
-            print(f"[EVNT] {event}: {data}")
+        if log_q is not None:
+            ts = payload.get("time")
+            if not isinstance(ts, int) or not -(1 << 63) <= ts < (1 << 63):
+                ts = 0
+            code = _codes.get(event, 0) if isinstance(event, str) else 0
+            log_q.put(_pack(ts, code, len(record)) + record)
+
+        # Formatters expect a dict; anything else a (possibly hostile) target
+        # sends is shown raw rather than crashing the reader.
+        fmt = _formatters.get(event) if isinstance(event, str) and isinstance(data, dict) else None
+        if fmt is None:
+            return f"[EVNT] {event}: {data}\n"
+        return fmt(data)
+
+def iter_event_log(path: str) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield ``(time_ns, event_code, json_body)`` for each record in an intercept log."""
+    with open(path, "rb") as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError(f"{path}: not a sandbox intercept log")
+        while True:
+            header = f.read(LOG_RECORD.size)
+            if len(header) < LOG_RECORD.size:
+                return  # EOF, or a record cut short by a crash
+            ts, code, size = LOG_RECORD.unpack(header)
+            body = f.read(size)
+            if len(body) < size:
+                return
+            yield ts, code, body
 
 RUN_USAGE = "run [--python|--py] <command> [args...]"
 
 
+# shlex's whitespace; str.split() would also split on \x0b, \x0c, \xa0, ...
+_SHLEX_SPACE_RE = re.compile(r"[ \t\r\n]+")
+
+
+def split_command(raw: str) -> List[str]:
+    # Without quotes or escapes, shlex would only split on that whitespace.
+    if '"' in raw or "'" in raw or "\\" in raw:
+        return shlex.split(raw)
+    return [token for token in _SHLEX_SPACE_RE.split(raw) if token]
+
+
 def parse_run_command(raw: str) -> Tuple[List[str], bool, bool]:
-    tokens = shlex.split(raw)
+    tokens = split_command(raw)
     if not tokens:
         raise ValueError("No command provided.")
 
@@ -390,14 +1272,7 @@ def main() -> None:
         if not cmd:
             print("[!] No command provided.")
             sys.exit(1)
-        runner = SandboxRunner()
-        try:
-            runner.start(cmd, force_python=args.force_python)
-            print("[*] Target started.")
-            if runner.reader_thread:
-                runner.reader_thread.join()
-        finally:
-            runner.stop()
+        SandboxRunner().run(cmd, force_python=args.force_python)
     else:
         interactive_console()
 
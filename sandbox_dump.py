@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""Convert a sandbox intercept log (events.bin) back to JSON lines.
+
+Usage: python sandbox_dump.py events.bin [--event dns] [--event http ...]
+"""
+import argparse
+import sys
+
+from sandbox_console import EVENT_CODES, iter_event_log
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Dump a sandbox intercept log as JSONL.")
+    parser.add_argument("path", help="Path to events.bin.")
+    parser.add_argument("--event", action="append", choices=sorted(EVENT_CODES), help="Only dump these event types (repeatable).")
+    args = parser.parse_args()
+
+    # Filtering uses the record header, so skipped records are never parsed.
+    codes = {EVENT_CODES[name] for name in args.event} if args.event else None
+    out = sys.stdout.buffer
+    try:
+        for _, code, body in iter_event_log(args.path):
+            if codes is None or code in codes:
+                out.write(body + b"\n")
+    except (OSError, ValueError) as exc:
+        print(f"[!] {exc}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()